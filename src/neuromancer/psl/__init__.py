@@ -1,21 +1,17 @@
-import neuromancer.psl.autonomous as auto
-import neuromancer.psl.nonautonomous as nauto
-import neuromancer.psl.ssm as ssm
-import neuromancer.psl.coupled_systems as cs
-import neuromancer.psl.emulator as emulator
-import neuromancer.psl.plot as plot
 from neuromancer.psl.perturb import *
-import toml
+import importlib
 import os
 
-try:
-    with open("pyproject.toml") as f:
-        _pyproject = toml.load(f)
-
-    repo = _pyproject["project"]["urls"]["repository"]
-    'https://github.com/clegaard/neuromancer/'
-except Exception as e:
-    raise RuntimeError("Unable to extract the project.urls.repository from `pyproject.toml`") from e
+# Submodules, and the aliases they are exposed under, imported on first access (PEP 562) so that using one
+# family of systems does not pay for importing the others, or matplotlib through plot
+_submodules = {
+    'auto': 'autonomous', 'autonomous': 'autonomous',
+    'nauto': 'nonautonomous', 'nonautonomous': 'nonautonomous',
+    'ssm': 'ssm',
+    'cs': 'coupled_systems', 'coupled_systems': 'coupled_systems',
+    'emulator': 'emulator',
+    'plot': 'plot',
+}
 
 resource_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
 
@@ -33,6 +29,20 @@ datasets = {
     }.items()
 }
 
-systems = {**auto.systems, **nauto.systems, **ssm.systems, **cs.systems}
-emulators = systems
+
+def __getattr__(name):
+    if name in _submodules:
+        module = importlib.import_module(f'.{_submodules[name]}', __name__)
+        globals()[name] = module
+        return module
+    if name in ('systems', 'emulators'):
+        systems = {**__getattr__('auto').systems, **__getattr__('nauto').systems,
+                   **__getattr__('ssm').systems, **__getattr__('cs').systems}
+        globals().update(systems=systems, emulators=systems)
+        return systems
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted({*globals(), *_submodules, 'systems', 'emulators'})
 
@@ -10,36 +10,96 @@ References:
     + https://en.wikipedia.org/wiki/List_of_dynamical_systems_and_differential_equations_topics
 """
 # Core python
-import inspect, sys, functools
+import functools, operator, os, hashlib, tempfile, warnings
 # Numerical, ML
 import scipy, torch, torchdiffeq, numpy
+import neuromancer
+
+try:
+    import numba
+    prange = numba.prange
+except ImportError:
+    numba = None
+    prange = range
+
+
+def jit(fun=None, parallel=False):
+    """
+    Compile a right hand side kernel to native code with numba. Compilation happens on the first call and is
+    cached on disk (cache=True), so later sessions skip it. Without numba the plain python function is returned
+    and the numpy backend uses the vectorized backend generic equations instead of the kernels.
+    Use as @jit, or as @jit(parallel=True) for functions looping over prange.
+    """
+    if fun is None:
+        return functools.partial(jit, parallel=parallel)
+    if numba is None:
+        return fun
+    return numba.njit(cache=True, fastmath=True, parallel=parallel)(fun)
 
 
 def grad(tensor, requires_grad):
-    tensor.requires_grad = requires_grad
-    return tensor
+    """
+    Wrap a parameter tensor as nn.Parameter so it is registered with the module and moved by .to(device)
+    """
+    return torch.nn.Parameter(tensor, requires_grad=requires_grad)
+
+
+# Registry of the autonomous systems by class name, populated by _register
+systems = {}
+
+
+def _register(cls):
+    systems[cls.__name__] = cls
+    return cls
+
+
+def _stack_last(xs):
+    """
+    Stack the state derivatives along the last axis. Building the array and transposing it is several times
+    cheaper than numpy.stack, above all for the scalar derivatives of a single state
+    """
+    return numpy.array(xs).T
+
+
+def _clip_numpy(x, low, high):
+    """
+    numpy.clip, using the builtin min and max for scalars where numpy.clip costs about ten times more
+    """
+    return min(max(x, low), high) if numpy.ndim(x) == 0 else numpy.clip(x, low, high)
 
 
 class Backend:
     numpy_backend = {'odeint': functools.partial(scipy.integrate.odeint, tfirst=True),
                      'cat': numpy.concatenate,
-                     'cast': numpy.array,
+                     'cast': numpy.asarray,
+                     'stack': _stack_last,
+                     'unstack': operator.attrgetter('T'),
+                     'clip': _clip_numpy,
                      'core': numpy,
                      'grad': lambda x, requires_grad: x,
-                     'seed': numpy.random.seed}
+                     'seed': numpy.random.seed,
+                     'jit': numba is not None}
     torch_backend = {'odeint': torchdiffeq.odeint,
                      'cat': torch.cat,
-                     'cast': torch.tensor,
+                     'cast': torch.as_tensor,
+                     'stack': functools.partial(torch.stack, dim=-1),
+                     'unstack': functools.partial(torch.unbind, dim=-1),
+                     'clip': torch.clip,
                      'core': torch,
                      'grad': grad,
-                     'seed': torch.manual_seed}
+                     'seed': torch.manual_seed,
+                     'jit': False}
     backends = {'torch': torch_backend,
-                'numpy': numpy_backend}
+                'numpy': numpy_backend,
+                'numba': numpy_backend}
 
     def __init__(self, backend):
         """
-        backend: can be torch or numpy
+        backend: can be torch, numpy or numba. numba uses the numpy backend but integrates with a compiled
+                 fixed step RK4 scheme instead of scipy's odeint
         """
+        if backend == 'numba' and numba is None:
+            raise ImportError("backend='numba' requires numba, install it with pip install neuromancer[jit]")
         for k, v in Backend.backends[backend].items():
             setattr(self, k, v)
 
@@ -53,19 +113,148 @@ import random
 import numpy as np
 
 
+@jit
+def _rk4(rhs, params, x0, Time, substeps):
+    """
+    Fixed step fourth order Runge-Kutta integration of a compiled right hand side kernel
+
+    :param rhs: (callable) kernel with signature rhs(t, x, *params, dx) writing the derivative into dx
+    :param params: (tuple) float parameters of the kernel
+    :param x0: (np.array shape=(nx,)) initial state
+    :param Time: (np.array shape=(nsim+1,)) time points at which to return the state
+    :param substeps: (int) number of RK4 steps taken between consecutive time points
+    :return: (np.array shape=(nsim+1, nx)) state trajectory
+    """
+    nx = x0.shape[0]
+    X = np.empty((Time.shape[0], nx))
+    X[0] = x0
+    x = x0.copy()
+    xk = np.empty(nx)
+    k1, k2, k3, k4 = np.empty(nx), np.empty(nx), np.empty(nx), np.empty(nx)
+    for n in range(Time.shape[0] - 1):
+        h = (Time[n + 1] - Time[n]) / substeps
+        for m in range(substeps):
+            t = Time[n] + m * h
+            rhs(*((t, x) + params + (k1,)))
+            for i in range(nx):
+                xk[i] = x[i] + 0.5 * h * k1[i]
+            rhs(*((t + 0.5 * h, xk) + params + (k2,)))
+            for i in range(nx):
+                xk[i] = x[i] + 0.5 * h * k2[i]
+            rhs(*((t + 0.5 * h, xk) + params + (k3,)))
+            for i in range(nx):
+                xk[i] = x[i] + h * k3[i]
+            rhs(*((t + h, xk) + params + (k4,)))
+            for i in range(nx):
+                x[i] += h / 6. * (k1[i] + 2. * k2[i] + 2. * k3[i] + k4[i])
+        X[n + 1] = x
+    return X
+
+
+@jit(parallel=True)
+def _rk4_batch(rhs, params, X0, Time, substeps):
+    """
+    Integrate a batch of initial conditions with _rk4, trajectories are distributed over threads
+
+    :param X0: (np.array shape=(nbatch, nx)) batch of state initial conditions
+    :return: (np.array shape=(nsim+1, nbatch, nx)) state trajectories
+    """
+    X = np.empty((Time.shape[0], X0.shape[0], X0.shape[1]))
+    for b in prange(X0.shape[0]):
+        X[:, b] = _rk4(rhs, params, X0[b], Time, substeps)
+    return X
+
+
+def stats_cache_dir():
+    """
+    Per user directory holding simulated state statistics of systems, keyed by a hash of their configuration.
+    $NEUROMANCER_CACHE_DIR if set, otherwise $XDG_CACHE_HOME/neuromancer defaulting to ~/.cache/neuromancer
+    """
+    if os.environ.get('NEUROMANCER_CACHE_DIR'):
+        return os.environ['NEUROMANCER_CACHE_DIR']
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'neuromancer')
+
+
+@functools.lru_cache(maxsize=None)
+def _source_hash(cls):
+    """
+    Hash of the source files defining the simulated trajectories of a system class, i.e. its equations,
+    Jacobian and kernel together with the solvers, so cached statistics are invalidated when any of them change
+    """
+    funs = [cls.equations, cls.jacobian, cls._kernel, cls.get_stats, cls.simulate, cls._rhs, cls._integrate_rk4,
+            _rk4, _rk4_batch]
+    h = hashlib.sha1()
+    for path in sorted({getattr(fun, 'py_func', fun).__code__.co_filename for fun in funs if fun is not None}):
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
 class ODE_Autonomous(torch.nn.Module):
     """
     base class autonomous ODE
     """
-    def __init__(self, nsim=1001, ninit=0., ts=0.1, seed=59, x0=0., backend='numpy', requires_grad=False):
+    # Compiled right hand side kernel and the names of the parameters it takes, used by the numba backend
+    _kernel = None
+    _kernel_params = ()
+    # Number of RK4 steps per sampling interval for the numba backend
+    rk4_substeps = 10
+    # Optional analytic Jacobian jacobian(t, x) -> np.array shape=(nx, nx) of equations with respect to the state,
+    # passed to scipy's odeint as Dfun. numpy only and for a single state x with shape=(nx,), it does not
+    # broadcast over batches and is not used by the torch or numba backends. Without it odeint uses finite differences
+    jacobian = None
+
+    def __init__(self, nsim=1001, ninit=0., ts=0.1, seed=59, x0=None, backend='numpy', requires_grad=False, adjoint=False):
         super().__init__()
+        if backend == 'numba' and self._kernel is None:
+            raise NotImplementedError(f"{type(self).__name__} defines no compiled _kernel, backend='numba' is not "
+                                      "available for it, use backend='numpy'")
         self.B = Backend(backend)
+        # Bind the backend functions used by equations once, saving two attribute lookups per call
+        self._sin, self._cos, self._exp = self.B.core.sin, self.B.core.cos, self.B.core.exp
+        self._cast, self._stack, self._unstack, self._clip = self.B.cast, self.B.stack, self.B.unstack, self.B.clip
+        self.backend_name = backend
+        self.requires_grad = requires_grad
+        # Backpropagate through the torch solver with the adjoint method instead of through its internal steps
+        self.adjoint = adjoint
 
         random.seed(seed)
         self.B.seed(seed)
         self.seed = seed
 
-        self.nsim, self.ninit, self.ts, self.x0 = nsim, ninit, ts, self.B.cast(x0)
+        self.nsim, self.ninit, self.ts = nsim, ninit, ts
+        # Size of the leading batch dimension of the parameters, None for a single system, see batched
+        self.nbatch = None
+        # Subclasses assign their nominal x0 after this, so it is only cast here when given
+        x0 = self._cast(x0) if x0 is not None else None
+        if backend == 'torch':
+            # Buffers follow the parameters on .to(device), registering None keeps the slot for subclasses
+            self.register_buffer('x0', x0)
+        else:
+            self.x0 = x0
+
+    @classmethod
+    def batched(cls, params, x0=None, **kwargs):
+        """
+        Construct a single system whose parameters have a leading batch dimension, e.g. for parameter sweeps.
+        The generic equations broadcast over the batch, so all instances are integrated by one solver call
+        with one vectorized right hand side. Parameters not given keep their nominal scalar values.
+
+        :param params: (dict {str: array shape=(nbatch,)}) batched parameter values keyed by parameter name
+        :param x0: (array shape=(nbatch, nx)) batch of initial conditions, defaults to the nominal x0 of every instance
+        :param kwargs: further arguments of the system constructor
+        :return: (ODE_Autonomous) system simulating nbatch instances at once
+        """
+        system = cls(**kwargs)
+        assert set(params) <= set(cls._kernel_params), f"{cls.__name__} parameters are {cls._kernel_params}"
+        values = system.set_params(list(params.values()), system.requires_grad)
+        system.nbatch = len(values[0])
+        assert all(v.shape == (system.nbatch,) for v in values), "Batched parameters must have shape (nbatch,)"
+        for name, value in zip(params, values):
+            setattr(system, name, value)
+        system.x0 = system._cast(x0) if x0 is not None else system.x0 * system.B.core.ones((system.nbatch, 1))
+        return system
 
     def get_stats(self):
         """
@@ -82,6 +271,41 @@ class ODE_Autonomous(torch.nn.Module):
                 'mean': X.mean(axis=0), 'var': X.var(axis=0),
                 'std': X.std(axis=0)}
 
+    @functools.cached_property
+    def xstats(self):
+        """
+        Statistics of the nominal trajectory, see get_stats. Computed on first access and, for the numpy
+        based backends, cached on disk so identically configured systems do not re-simulate.
+        """
+        if self.backend_name == 'torch' or self.nbatch is not None:
+            return self.get_stats()
+        try:
+            source = _source_hash(type(self))
+        except OSError:
+            # Source code is not available, there is no safe way to tell whether a cache entry is stale
+            return self.get_stats()
+        # Every public scalar and array attribute, i.e. the parameters, x0 and the simulation settings, enters the
+        # key so that systems not listing their parameters in _kernel_params are keyed correctly as well
+        config = tuple((k, v.tobytes() if isinstance(v, np.ndarray) else v) for k, v in sorted(vars(self).items())
+                       if not k.startswith('_') and isinstance(v, (int, float, str, np.ndarray)))
+        key = (neuromancer.__version__, source, type(self).__name__, self.rk4_substeps, config)
+        cache_dir = stats_cache_dir()
+        path = os.path.join(cache_dir, hashlib.sha1(repr(key).encode()).hexdigest() + '.npz')
+        if os.path.exists(path):
+            with np.load(path) as stats:
+                return dict(stats)
+        stats = self.get_stats()
+        try:
+            # Write to a temporary file first so concurrent processes never read a partial cache entry
+            os.makedirs(cache_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.tmp', delete=False) as f:
+                np.savez(f, **stats)
+            os.replace(f.name, path)
+        except OSError:
+            # Unwritable cache directory, statistics are simply recomputed next time
+            pass
+        return stats
+
     def get_x0(self):
         """
         Randomly sample an initial condition
@@ -91,7 +315,10 @@ class ODE_Autonomous(torch.nn.Module):
         return np.random.uniform(low=self.xstats['min'], high=self.xstats['max'])
 
     def set_params(self, parameters, requires_grad):
-        return [self.B.grad(self.B.cast(p), requires_grad) for p in parameters]
+        if self.backend_name != 'torch':
+            # Gradients are not tracked by numpy, and arithmetic on python floats skips the ufunc dispatch of 0-d arrays
+            return [float(p) if np.ndim(p) == 0 else self._cast(p, dtype=np.float64) for p in parameters]
+        return [self.B.grad(self._cast(p), requires_grad) for p in parameters]
 
     def simulate(self, ninit=None, nsim=None, Time=None, ts=None, x0=None):
 
@@ -107,12 +334,89 @@ class ODE_Autonomous(torch.nn.Module):
         ts = ts if ts is not None else self.ts
         x0 = x0 if x0 is not None else self.x0
         Time = Time if Time is not None else self.B.core.arange(0, nsim+1) * ts + ninit
+        if self.nbatch is not None:
+            return self.simulate_batch(x0, Time=Time)
         assert x0.shape[0] % self.nx == 0, "Mismatch in x0 size"
 
-        X = self.B.odeint(self.equations, x0, Time)
+        if self.backend_name == 'numba':
+            X = self._integrate_rk4(x0, Time)
+        elif self.backend_name == 'torch':
+            X = self._integrate_torch(x0, Time)
+        else:
+            X = self.B.odeint(self._rhs(), x0, Time, Dfun=self.jacobian)
         return {'Y': X.reshape(nsim+1, -1), 'X': X}
 
+    def simulate_batch(self, X0, ninit=None, nsim=None, Time=None, ts=None):
+        """
+        Simulate a batch of trajectories from different initial conditions. The torch backend integrates the
+        whole batch in a single solver call, broadcasting the right hand side along the leading axis. The numba
+        backend integrates trajectories in parallel in compiled code. With numpy every trajectory gets its own
+        odeint call, because a flattened system would force all of them onto the step size of the stiffest one.
+        Systems with batched parameters (see batched) are the exception: their parameters only broadcast in the
+        generic equations, so with numpy and numba the flattened batch is integrated by a single odeint call.
+
+        :param X0: (np.array or torch.Tensor shape=(nbatch, nx)) batch of state initial conditions
+        :param nsim: (int) Number of steps for open loop response
+        :param ninit: (float) initial simulation time
+        :param ts: (float) step size, sampling time
+        :return: The response matrices X and Y with shape=(nsim+1, nbatch, nx)
+        """
+        ninit = ninit if ninit is not None else self.ninit
+        nsim = nsim if nsim is not None else self.nsim
+        ts = ts if ts is not None else self.ts
+        Time = Time if Time is not None else self.B.core.arange(0, nsim+1) * ts + ninit
+        assert X0.ndim == 2 and X0.shape[1] == self.nx, "Batch of initial conditions must have shape (nbatch, nx)"
+
+        if self.nbatch is not None and self.backend_name != 'torch':
+            nbatch = X0.shape[0]
+            X = self.B.odeint(lambda t, x: self.equations(t, x.reshape(nbatch, -1)).ravel(), X0.ravel(), Time)
+            X = X.reshape(-1, nbatch, self.nx)
+        elif self.backend_name == 'numba':
+            X = _rk4_batch(self._kernel, self._params(), np.asarray(X0, dtype=np.float64),
+                           np.asarray(Time, dtype=np.float64), self.rk4_substeps)
+        elif self.backend_name == 'torch':
+            X = self._integrate_torch(X0, Time)
+        else:
+            X = np.stack([self.B.odeint(self._rhs(), x0, Time, Dfun=self.jacobian) for x0 in X0], axis=1)
+        return {'Y': X, 'X': X}
+
+    def _integrate_torch(self, x0, Time):
+        Time = torch.as_tensor(Time, dtype=x0.dtype, device=x0.device)
+        if self.adjoint:
+            # Adjoint method keeps memory constant in the number of solver steps when backpropagating,
+            # at the cost of a second solve backwards in time
+            return torchdiffeq.odeint_adjoint(self.equations, x0, Time, adjoint_params=tuple(self.parameters()))
+        return self.B.odeint(self.equations, x0, Time)
+
+    def _params(self):
+        return tuple(float(getattr(self, p)) for p in self._kernel_params)
+
+    def _rhs(self):
+        """
+        Right hand side handed to odeint, with the kernel parameters bound once per solve. The compiled kernel
+        writes into the preallocated self._dx buffer, so each returned array is overwritten by the next call.
+        This is safe for odeint, which copies it, but use equations wherever the result is kept.
+        """
+        if not self.B.jit or self._kernel is None:
+            return self.equations
+        kernel, params, dx = self._kernel, self._params(), self._dx
+        return lambda t, x: kernel(t, x, *params, dx)
+
+    def _integrate_rk4(self, x0, Time):
+        return _rk4(self._kernel, self._params(), np.asarray(x0, dtype=np.float64),
+                    np.asarray(Time, dtype=np.float64), self.rk4_substeps)
+
 
+@jit
+def _universal_oscillator_rhs(t, x, mu, omega, dx):
+    dx[0] = x[1]
+    # The forcing is evaluated directly rather than looked up in a table precomputed over Time: odeint is adaptive
+    # and queries t between the time points, so a lookup needs a bisection per call that costs more than one cos
+    dx[1] = -2.*mu*x[1] - x[0] + np.cos(omega*t)
+    return dx
+
+
+@_register
 class UniversalOscillator(ODE_Autonomous):
     """
     Harmonic oscillator
@@ -121,23 +425,42 @@ class UniversalOscillator(ODE_Autonomous):
     + https://sam-dolan.staff.shef.ac.uk/mas212/notebooks/ODE_Example.html
     """
 
-    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False):
-        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad)
+    _kernel = staticmethod(_universal_oscillator_rhs)
+    _kernel_params = ('mu', 'omega')
+
+    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False, adjoint=False):
+        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad,
+                         adjoint=adjoint)
         mu = 2.
         omega = 1.
-        self.parameters = [mu, omega]
         self.mu, self.omega = self.set_params([mu, omega], requires_grad)
 
-        self.x0 = self.B.cast([1.0, 0.0])
+        self.x0 = self._cast([1.0, 0.0])
         self.nx = 2
-        self.xstats = self.get_stats()
+        self._dx = np.empty(self.nx)
 
     def equations(self, t, x):
-        dx1 = x[1]
-        dx2 = -2.*self.mu*x[1] - x[0] + self.B.core.cos(self.omega*t)
-        return self.B.cast([dx1, dx2])
+        if self.B.jit and x.ndim == 1:
+            return _universal_oscillator_rhs(t, x, float(self.mu), float(self.omega), np.empty(self.nx))
+        cos = self._cos
+        x1, x2 = self._unstack(x)
+        dx1 = x2
+        dx2 = -2.*self.mu*x2 - x1 + cos(self.omega*t)
+        return self._stack([dx1, dx2])
 
+    def jacobian(self, t, x):
+        return np.array([[0., 1.],
+                         [-1., -2.*self.mu]])
 
+
+@jit
+def _pendulum_rhs(t, x, g, f, dx):
+    dx[0] = x[1]
+    dx[1] = -f*x[1] - g*np.sin(x[0])
+    return dx
+
+
+@_register
 class Pendulum(ODE_Autonomous):
     """
     Simple pendulum.
@@ -145,30 +468,59 @@ class Pendulum(ODE_Autonomous):
     + https://docs.scipy.org/doc/scipy/reference/generated/scipy.integrate.odeint.html
     """
 
-    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False):
-        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad)
+    _kernel = staticmethod(_pendulum_rhs)
+    _kernel_params = ('g', 'f')
+
+    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False, adjoint=False):
+        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad,
+                         adjoint=adjoint)
         g = 9.81
         f = 3.
         self.g, self.f = self.set_params([g, f], requires_grad)
 
         self.nx = 2
-        self.x0 = self.B.cast([0., 1.])
-        self.xstats = self.get_stats()
+        self._dx = np.empty(self.nx)
+        self.x0 = self._cast([0., 1.])
 
     def equations(self, t, x):
-        theta = x[0]
-        omega = x[1]
-        return self.B.cast([omega, -self.f*omega - self.g*self.B.core.sin(theta)])
-
-
+        if self.B.jit and x.ndim == 1:
+            return _pendulum_rhs(t, x, float(self.g), float(self.f), np.empty(self.nx))
+        sin = self._sin
+        theta, omega = self._unstack(x)
+        return self._stack([omega, -self.f*omega - self.g*sin(theta)])
+
+    def jacobian(self, t, x):
+        return np.array([[0., 1.],
+                         [-self.g*np.cos(x[0]), -self.f]])
+
+
+@jit
+def _double_pendulum_rhs(t, x, L1, L2, m1, m2, g, dx):
+    theta1, z1, theta2, z2 = x[0], x[1], x[2], x[3]
+    c, s = np.cos(theta1 - theta2), np.sin(theta1 - theta2)
+    sin1, sin2 = np.sin(theta1), np.sin(theta2)
+    z1sq, z2sq = z1 * z1, z2 * z2
+    denom = 1.0 / (m1 + m2 * s * s)
+    dx[0] = z1
+    dx[1] = (m2 * g * sin2 * c - m2 * s * (L1 * z1sq * c + L2 * z2sq) - (m1 + m2) * g * sin1) * (denom / L1)
+    dx[2] = z2
+    dx[3] = ((m1 + m2) * (L1 * z1sq * s - g * sin2 + g * sin1 * c) + m2 * L2 * z2sq * s * c) * (denom / L2)
+    return dx
+
+
+@_register
 class DoublePendulum(ODE_Autonomous):
     """
     Double Pendulum
     https://scipython.com/blog/the-double-pendulum/
     """
 
-    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False):
-        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad)
+    _kernel = staticmethod(_double_pendulum_rhs)
+    _kernel_params = ('L1', 'L2', 'm1', 'm2', 'g')
+
+    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False, adjoint=False):
+        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad,
+                         adjoint=adjoint)
         L1 = 1.
         L2 = 1.
         m1 = 1.
@@ -176,25 +528,70 @@ class DoublePendulum(ODE_Autonomous):
         g = 9.81
         self.L1, self.L2, self.m1, self.m2, self.g = self.set_params([L1, L2, m1, m2, g], requires_grad)
 
-        self.x0 = self.B.cast([3 * self.B.core.pi / 7, 0, 3 * self.B.core.pi / 4, 0])
-        self.nx = 4.
-        self.xstats = self.get_stats()
+        self.x0 = self._cast([3 * self.B.core.pi / 7, 0, 3 * self.B.core.pi / 4, 0])
+        self.nx = 4
+        self._dx = np.empty(self.nx)
 
     def equations(self, t, x):
-        theta1 = x[0]
-        z1 = x[1]
-        theta2 = x[2]
-        z2 = x[3]
-        c, s = self.B.core.cos(theta1 - theta2), self.B.core.sin(theta1 - theta2)
+        if self.B.jit and x.ndim == 1:
+            return _double_pendulum_rhs(t, x, float(self.L1), float(self.L2),
+                                        float(self.m1), float(self.m2), float(self.g), np.empty(self.nx))
+        sin, cos = self._sin, self._cos
+        theta1, z1, theta2, z2 = self._unstack(x)
+        c, s = cos(theta1 - theta2), sin(theta1 - theta2)
+        sin1, sin2 = sin(theta1), sin(theta2)
+        z1sq, z2sq = z1 * z1, z2 * z2
+        denom = 1.0 / (self.m1 + self.m2 * s * s)
         dx1 = z1
-        dx2 = (self.m2 * self.g * self.B.core.sin(theta2) * c - self.m2 * s * (self.L1 * z1 ** 2 * c + self.L2 * z2 ** 2) -
-               (self.m1 + self.m2) * self.g * self.B.core.sin(theta1)) / self.L1 / (self.m1 + self.m2 * s ** 2)
+        dx2 = (self.m2 * self.g * sin2 * c - self.m2 * s * (self.L1 * z1sq * c + self.L2 * z2sq) -
+               (self.m1 + self.m2) * self.g * sin1) * (denom / self.L1)
         dx3 = z2
-        dx4 = ((self.m1 + self.m2) * (self.L1 * z1 ** 2 * s - self.g * self.B.core.sin(theta2) + self.g * self.B.core.sin(theta1) * c) +
-               self.m2 * self.L2 * z2 ** 2 * s * c) / self.L2 / (self.m1 + self.m2 * s ** 2)
-        return self.B.cast([dx1, dx2, dx3, dx4])
-
-
+        dx4 = ((self.m1 + self.m2) * (self.L1 * z1sq * s - self.g * sin2 + self.g * sin1 * c) +
+               self.m2 * self.L2 * z2sq * s * c) * (denom / self.L2)
+        return self._stack([dx1, dx2, dx3, dx4])
+
+    def jacobian(self, t, x):
+        theta1, z1, theta2, z2 = x[0], x[1], x[2], x[3]
+        c, s = np.cos(theta1 - theta2), np.sin(theta1 - theta2)
+        sin1, sin2, cos1, cos2 = np.sin(theta1), np.sin(theta2), np.cos(theta1), np.cos(theta2)
+        z1sq, z2sq = z1 * z1, z2 * z2
+        M = self.m1 + self.m2
+        D = self.m1 + self.m2 * s * s
+        dD = 2. * self.m2 * s * c  # dD/dtheta1 = -dD/dtheta2
+        c2s2 = c * c - s * s
+        N2 = self.m2 * self.g * sin2 * c - self.m2 * s * (self.L1 * z1sq * c + self.L2 * z2sq) - M * self.g * sin1
+        N4 = M * (self.L1 * z1sq * s - self.g * sin2 + self.g * sin1 * c) + self.m2 * self.L2 * z2sq * s * c
+        dN2_dtheta1 = (-self.m2 * self.g * sin2 * s - self.m2 * (self.L1 * z1sq * c2s2 + self.L2 * z2sq * c) -
+                       M * self.g * cos1)
+        dN2_dtheta2 = self.m2 * self.g * (cos2 * c + sin2 * s) + self.m2 * (self.L1 * z1sq * c2s2 + self.L2 * z2sq * c)
+        dN4_dtheta1 = M * (self.L1 * z1sq * c + self.g * (cos1 * c - sin1 * s)) + self.m2 * self.L2 * z2sq * c2s2
+        dN4_dtheta2 = M * (-self.L1 * z1sq * c - self.g * cos2 + self.g * sin1 * s) - self.m2 * self.L2 * z2sq * c2s2
+        J = np.zeros((4, 4))
+        J[0, 1] = 1.
+        J[2, 3] = 1.
+        J[1] = [dN2_dtheta1 - N2 * dD / D, -2. * self.m2 * s * self.L1 * z1 * c,
+                dN2_dtheta2 + N2 * dD / D, -2. * self.m2 * s * self.L2 * z2]
+        J[1] /= self.L1 * D
+        J[3] = [dN4_dtheta1 - N4 * dD / D, 2. * M * self.L1 * z1 * s,
+                dN4_dtheta2 + N4 * dD / D, 2. * self.m2 * self.L2 * z2 * s * c]
+        J[3] /= self.L2 * D
+        return J
+
+
+@jit
+def _lorenz96_rhs(t, x, F, dx):
+    N = x.shape[0]
+    # First the 3 edge cases: i=1,2,N
+    dx[0] = (x[1] - x[N - 2]) * x[N - 1] - x[0] + F
+    dx[1] = (x[2] - x[N - 1]) * x[0] - x[1] + F
+    dx[N - 1] = (x[0] - x[N - 3]) * x[N - 2] - x[N - 1] + F
+    # Then the general case
+    for i in range(2, N - 1):
+        dx[i] = (x[i + 1] - x[i - 2]) * x[i - 1] - x[i] + F
+    return dx
+
+
+@_register
 class Lorenz96(ODE_Autonomous):
     """
     Lorenz 96 model
@@ -202,8 +599,12 @@ class Lorenz96(ODE_Autonomous):
     + https://en.wikipedia.org/wiki/Lorenz_96_model
     """
 
-    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False):
-        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad)
+    _kernel = staticmethod(_lorenz96_rhs)
+    _kernel_params = ('F',)
+
+    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False, adjoint=False):
+        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad,
+                         adjoint=adjoint)
         F = 8.  # Forcing
         self.F, = self.set_params([F], requires_grad)
 
@@ -211,21 +612,36 @@ class Lorenz96(ODE_Autonomous):
         self.x0 = self.F*self.B.core.ones(self.N)
         self.x0[19] += 0.01  # Add small perturbation to random variable
         self.nx = self.N
-        self.xstats = self.get_stats()
+        self._dx = np.empty(self.nx)
+        # Cyclic neighbour indices i+1, i-1, i-2
+        idx = np.arange(self.N)
+        self._ip1, self._im1, self._im2 = (idx + 1) % self.N, (idx - 1) % self.N, (idx - 2) % self.N
 
     def equations(self, t, x):
-        dx = self.B.core.zeros(self.N)
-        # First the 3 edge cases: i=1,2,N
-        dx[0] = (x[1] - x[self.N - 2]) * x[self.N - 1] - x[0]
-        dx[1] = (x[2] - x[self.N - 1]) * x[0] - x[1]
-        dx[self.N - 1] = (x[0] - x[self.N - 3]) * x[self.N - 2] - x[self.N - 1]
-        # Then the general case
-        for i in range(2, self.N - 1):
-            dx[i] = (x[i + 1] - x[i - 2]) * x[i - 1] - x[i]
-        # Add the forcing term
-        return dx + self.F
-
-
+        if self.B.jit and x.ndim == 1:
+            return _lorenz96_rhs(t, x, float(self.F), np.empty(self.nx))
+        # Batched forcing has shape (nbatch,) and must broadcast against the leading axis of the states
+        F = self.F if self.nbatch is None else self.F[:, None]
+        return (x[..., self._ip1] - x[..., self._im2]) * x[..., self._im1] - x + F
+
+    def jacobian(self, t, x):
+        idx = np.arange(self.N)
+        J = -np.eye(self.N)
+        J[idx, self._ip1] += x[self._im1]
+        J[idx, self._im2] -= x[self._im1]
+        J[idx, self._im1] += x[self._ip1] - x[self._im2]
+        return J
+
+
+@jit
+def _lorenz_rhs(t, x, sigma, rho, beta, dx):
+    dx[0] = sigma*(x[1] - x[0])
+    dx[1] = x[0]*(rho - x[2]) - x[1]
+    dx[2] = x[0]*x[1] - beta*x[2]
+    return dx
+
+
+@_register
 class LorenzSystem(ODE_Autonomous):
     """
     Lorenz System
@@ -236,24 +652,45 @@ class LorenzSystem(ODE_Autonomous):
     + https://matplotlib.org/3.1.0/gallery/mplot3d/lorenz_attractor.html
     """
 
-    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False):
-        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad)
+    _kernel = staticmethod(_lorenz_rhs)
+    _kernel_params = ('sigma', 'rho', 'beta')
+
+    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False, adjoint=False):
+        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad,
+                         adjoint=adjoint)
         rho = 28.0
         sigma = 10.0
         beta = 8.0 / 3.0
         self.rho, self.sigma, self.beta = self.set_params([rho, sigma, beta], requires_grad)
 
-        self.x0 = self.B.cast([1.0, 1.0, 1.0])
+        self.x0 = self._cast([1.0, 1.0, 1.0])
         self.nx = 3
-        self.xstats = self.get_stats()
+        self._dx = np.empty(self.nx)
 
     def equations(self, t, x):
-        dx1 = self.sigma*(x[1] - x[0])
-        dx2 = x[0]*(self.rho - x[2]) - x[1]
-        dx3 = x[0]*x[1] - self.beta*x[2]
-        return self.B.cast([dx1, dx2, dx3])
+        if self.B.jit and x.ndim == 1:
+            return _lorenz_rhs(t, x, float(self.sigma), float(self.rho), float(self.beta), np.empty(self.nx))
+        x1, x2, x3 = self._unstack(x)
+        dx1 = self.sigma*(x2 - x1)
+        dx2 = x1*(self.rho - x3) - x2
+        dx3 = x1*x2 - self.beta*x3
+        return self._stack([dx1, dx2, dx3])
+
+    def jacobian(self, t, x):
+        return np.array([[-self.sigma, self.sigma, 0.],
+                         [self.rho - x[2], -1., -x[0]],
+                         [x[1], x[0], -self.beta]])
 
 
+@jit
+def _van_der_pol_rhs(t, x, mu, dx):
+    x0sq = x[0]*x[0]
+    dx[0] = mu*(x[0]*(1. - x0sq*(1./3.)) - x[1])
+    dx[1] = x[0]/mu
+    return dx
+
+
+@_register
 class VanDerPol(ODE_Autonomous):
     """
     Van der Pol oscillator
@@ -262,21 +699,42 @@ class VanDerPol(ODE_Autonomous):
     + http://kitchingroup.cheme.cmu.edu/blog/2013/02/02/Solving-a-second-order-ode/
     """
 
-    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False):
-        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad)
+    _kernel = staticmethod(_van_der_pol_rhs)
+    _kernel_params = ('mu',)
+
+    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False, adjoint=False):
+        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad,
+                         adjoint=adjoint)
         mu = 1.0
         self.mu, = self.set_params([mu], requires_grad)
 
-        self.x0 = self.B.cast([1., 2.])
+        self.x0 = self._cast([1., 2.])
         self.nx = 2
-        self.xstats = self.get_stats()
+        self._dx = np.empty(self.nx)
 
     def equations(self, t, x):
-        dx1 = self.mu*(x[0] - 1./3.*x[0]**3 - x[1])
-        dx2= x[0]/self.mu
-        return self.B.cast([dx1, dx2])
+        if self.B.jit and x.ndim == 1:
+            return _van_der_pol_rhs(t, x, float(self.mu), np.empty(self.nx))
+        x1, x2 = self._unstack(x)
+        x1sq = x1*x1
+        dx1 = self.mu*(x1*(1. - x1sq*(1./3.)) - x2)
+        dx2 = x1/self.mu
+        return self._stack([dx1, dx2])
+
+    def jacobian(self, t, x):
+        return np.array([[self.mu*(1. - x[0]**2), -self.mu],
+                         [1./self.mu, 0.]])
 
 
+@jit
+def _thomas_rhs(t, x, b, dx):
+    dx[0] = np.sin(x[1]) - b*x[0]
+    dx[1] = np.sin(x[2]) - b*x[1]
+    dx[2] = np.sin(x[0]) - b*x[2]
+    return dx
+
+
+@_register
 class ThomasAttractor(ODE_Autonomous):
     """
     Thomas' cyclically symmetric attractor
@@ -284,22 +742,43 @@ class ThomasAttractor(ODE_Autonomous):
     + https://en.wikipedia.org/wiki/Thomas%27_cyclically_symmetric_attractor
     """
 
-    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False):
-        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad)
+    _kernel = staticmethod(_thomas_rhs)
+    _kernel_params = ('b',)
+
+    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False, adjoint=False):
+        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad,
+                         adjoint=adjoint)
         b = 0.208186
         self.b, = self.set_params([b], requires_grad)
 
-        self.x0 = self.B.cast([1., -1., 1.])
+        self.x0 = self._cast([1., -1., 1.])
         self.nx = 3
-        self.xstats = self.get_stats()
+        self._dx = np.empty(self.nx)
+        # Cyclic successor indices i+1, the three equations are one formula rotated
+        self._roll_idx = np.array([1, 2, 0])
 
     def equations(self, t, x):
-        dx1 = self.B.core.sin(x[1]) - self.b*x[0]
-        dx2 = self.B.core.sin(x[2]) - self.b*x[1]
-        dx3 = self.B.core.sin(x[0]) - self.b*x[2]
-        return self.B.cast([dx1, dx2, dx3])
+        if self.B.jit and x.ndim == 1:
+            return _thomas_rhs(t, x, float(self.b), np.empty(self.nx))
+        # Batched b has shape (nbatch,) and must broadcast against the leading axis of the states
+        b = self.b if self.nbatch is None else self.b[:, None]
+        return self._sin(x[..., self._roll_idx]) - b*x
 
+    def jacobian(self, t, x):
+        return np.array([[-self.b, np.cos(x[1]), 0.],
+                         [0., -self.b, np.cos(x[2])],
+                         [np.cos(x[0]), 0., -self.b]])
 
+
+@jit
+def _rossler_rhs(t, x, a, b, c, dx):
+    dx[0] = - x[1] - x[2]
+    dx[1] = x[0] + a*x[1]
+    dx[2] = b + x[2]*(x[0] - c)
+    return dx
+
+
+@_register
 class RosslerAttractor(ODE_Autonomous):
     """
     Rössler attractor
@@ -307,24 +786,45 @@ class RosslerAttractor(ODE_Autonomous):
     + https://en.wikipedia.org/wiki/R%C3%B6ssler_attractor
     """
 
-    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False):
-        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad)
+    _kernel = staticmethod(_rossler_rhs)
+    _kernel_params = ('a', 'b', 'c')
+
+    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False, adjoint=False):
+        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad,
+                         adjoint=adjoint)
         a = 0.2
         b = 0.2
         c = 5.7
         self.a, self.b, self.c = self.set_params([a, b, c], requires_grad)
 
-        self.x0 = self.B.cast([0., 0., 0.])
+        self.x0 = self._cast([0., 0., 0.])
         self.nx = 3
-        self.xstats = self.get_stats()
+        self._dx = np.empty(self.nx)
 
     def equations(self, t, x):
-        dx1 = - x[1] - x[2]
-        dx2 = x[0] + self.a*x[1]
-        dx3 = self.b + x[2]*(x[0]-self.c)
-        return self.B.cast([dx1, dx2, dx3])
+        if self.B.jit and x.ndim == 1:
+            return _rossler_rhs(t, x, float(self.a), float(self.b), float(self.c), np.empty(self.nx))
+        x1, x2, x3 = self._unstack(x)
+        dx1 = - x2 - x3
+        dx2 = x1 + self.a*x2
+        dx3 = self.b + x3*(x1-self.c)
+        return self._stack([dx1, dx2, dx3])
+
+    def jacobian(self, t, x):
+        return np.array([[0., -1., -1.],
+                         [1., self.a, 0.],
+                         [x[2], 0., x[0] - self.c]])
+
 
+@jit
+def _lotka_volterra_rhs(t, x, a, b, c, d, dx):
+    xy = x[0]*x[1]
+    dx[0] = a*x[0] - b*xy
+    dx[1] = -c*x[1] + d*b*xy
+    return dx
 
+
+@_register
 class LotkaVolterra(ODE_Autonomous):
     """
     Lotka–Volterra equations, also known as the predator–prey equations
@@ -332,24 +832,45 @@ class LotkaVolterra(ODE_Autonomous):
     + https://en.wikipedia.org/wiki/Lotka%E2%80%93Volterra_equations
     """
 
-    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False):
-        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad)
+    _kernel = staticmethod(_lotka_volterra_rhs)
+    _kernel_params = ('a', 'b', 'c', 'd')
+
+    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False, adjoint=False):
+        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad,
+                         adjoint=adjoint)
         a = 1.
         b = 0.1
         c = 1.5
         d = 0.75
         self.a, self.b, self.c, self.d = self.set_params([a, b, c, d], requires_grad)
 
-        self.x0 = self.B.cast([5., 100.])
+        self.x0 = self._cast([5., 100.])
         self.nx = 2
-        self.xstats = self.get_stats()
+        self._dx = np.empty(self.nx)
 
     def equations(self, t, x):
-        dx1 = self.a*x[0] - self.b*x[0]*x[1]
-        dx2 = -self.c*x[1] + self.d*self.b*x[0]*x[1]
-        return self.B.cast([dx1, dx2])
+        if self.B.jit and x.ndim == 1:
+            return _lotka_volterra_rhs(t, x, float(self.a), float(self.b), float(self.c), float(self.d),
+                                       np.empty(self.nx))
+        x1, x2 = self._unstack(x)
+        xy = x1*x2
+        dx1 = self.a*x1 - self.b*xy
+        dx2 = -self.c*x2 + self.d*self.b*xy
+        return self._stack([dx1, dx2])
+
+    def jacobian(self, t, x):
+        return np.array([[self.a - self.b*x[1], -self.b*x[0]],
+                         [self.d*self.b*x[1], -self.c + self.d*self.b*x[0]]])
+
 
+@jit
+def _brusselator_rhs(t, x, a, b, dx):
+    dx[0] = a + x[1]*x[0]**2 - b*x[0] - x[0]
+    dx[1] = b*x[0] - x[1]*x[0]**2
+    return dx
 
+
+@_register
 class Brusselator1D(ODE_Autonomous):
     """
     Brusselator
@@ -357,21 +878,43 @@ class Brusselator1D(ODE_Autonomous):
     + https://en.wikipedia.org/wiki/Brusselator
     """
 
-    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False):
-        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad)
+    _kernel = staticmethod(_brusselator_rhs)
+    _kernel_params = ('a', 'b')
+
+    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False, adjoint=False):
+        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad,
+                         adjoint=adjoint)
         a = 1.0
         b = 3.0
         self.a, self.b = self.set_params([a, b], requires_grad)
-        self.x0 = self.B.cast([1.0, 1.0])
+        self.x0 = self._cast([1.0, 1.0])
         self.nx = 2
-        self.xstats = self.get_stats()
+        self._dx = np.empty(self.nx)
 
     def equations(self, t, x):
-        dx1 = self.a + x[1]*x[0]**2 -self.b*x[0] - x[0]
-        dx2 = self.b*x[0] - x[1]*x[0]**2
-        return self.B.cast([dx1, dx2])
+        if self.B.jit and x.ndim == 1:
+            return _brusselator_rhs(t, x, float(self.a), float(self.b), np.empty(self.nx))
+        x1, x2 = self._unstack(x)
+        dx1 = self.a + x2*x1**2 -self.b*x1 - x1
+        dx2 = self.b*x1 - x2*x1**2
+        return self._stack([dx1, dx2])
+
+    def jacobian(self, t, x):
+        return np.array([[2.*x[0]*x[1] - self.b - 1., x[0]**2],
+                         [self.b - 2.*x[0]*x[1], -x[0]**2]])
 
 
+@jit
+def _chua_rhs(t, x, a, b, m0, m1, dx):
+    # 0.5*(|x + 1| - |x - 1|) is x clipped to [-1, 1]
+    fx = m1*x[0] + (m0 - m1)*np.minimum(1., np.maximum(-1., x[0]))
+    dx[0] = a*(x[1] - x[0] - fx)
+    dx[1] = x[0] - x[1] + x[2]
+    dx[2] = -b*x[1]
+    return dx
+
+
+@_register
 class ChuaCircuit(ODE_Autonomous):
     """
     Chua's circuit
@@ -380,8 +923,12 @@ class ChuaCircuit(ODE_Autonomous):
     + https://www.chuacircuits.com/matlabsim.php
     """
 
-    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False):
-        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad)
+    _kernel = staticmethod(_chua_rhs)
+    _kernel_params = ('a', 'b', 'm0', 'm1')
+
+    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False, adjoint=False):
+        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad,
+                         adjoint=adjoint)
         # parameters
         a = 15.6
         b = 28.0
@@ -389,18 +936,36 @@ class ChuaCircuit(ODE_Autonomous):
         m1 = -0.714
         self.a, self.b, self.m0, self.m1 = self.set_params([a, b, m0, m1], requires_grad)
 
-        self.x0 = self.B.cast([0.7, 0.0, 0.0])
+        self.x0 = self._cast([0.7, 0.0, 0.0])
         self.nx = 3
-        self.xstats = self.get_stats()
+        self._dx = np.empty(self.nx)
 
     def equations(self, t, x):
-        fx = self.m1*x[0] + 0.5*(self.m0 - self.m1)*(self.B.core.abs(x[0] + 1) - self.B.core.abs(x[0] - 1))
-        dx1 = self.a*(x[1] - x[0] - fx)
-        dx2 = x[0] - x[1] + x[2]
-        dx3 = -self.b*x[1]
-        return self.B.cast([dx1, dx2, dx3])
-
-
+        if self.B.jit and x.ndim == 1:
+            return _chua_rhs(t, x, float(self.a), float(self.b), float(self.m0), float(self.m1), np.empty(self.nx))
+        x1, x2, x3 = self._unstack(x)
+        fx = self.m1*x1 + (self.m0 - self.m1)*self._clip(x1, -1., 1.)
+        dx1 = self.a*(x2 - x1 - fx)
+        dx2 = x1 - x2 + x3
+        dx3 = -self.b*x2
+        return self._stack([dx1, dx2, dx3])
+
+    def jacobian(self, t, x):
+        # Slope of the piecewise linear diode characteristic
+        dfx = self.m0 if abs(x[0]) < 1. else self.m1
+        return np.array([[-self.a*(1. + dfx), self.a, 0.],
+                         [1., -1., 1.],
+                         [0., -self.b, 0.]])
+
+
+@jit
+def _duffing_rhs(t, x, delta, alpha, beta, gamma, omega, dx):
+    dx[0] = x[1]
+    dx[1] = - delta*x[1] - alpha*x[0] - beta*x[0]**3 + gamma*np.cos(omega*t)
+    return dx
+
+
+@_register
 class Duffing(ODE_Autonomous):
     """
     Duffing equation
@@ -408,8 +973,12 @@ class Duffing(ODE_Autonomous):
     + https://en.wikipedia.org/wiki/Duffing_equation
     """
 
-    def __init__(self, nsim=3001, ninit=0, ts=0.01, seed=59, backend='numpy', requires_grad=False):
-        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad)
+    _kernel = staticmethod(_duffing_rhs)
+    _kernel_params = ('delta', 'alpha', 'beta', 'gamma', 'omega')
+
+    def __init__(self, nsim=3001, ninit=0, ts=0.01, seed=59, backend='numpy', requires_grad=False, adjoint=False):
+        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad,
+                         adjoint=adjoint)
         delta = 0.02
         alpha = 1.
         beta = 5.
@@ -417,16 +986,35 @@ class Duffing(ODE_Autonomous):
         omega = 0.5
         self.delta, self.alpha, self.beta, self.gamma, self.omega = self.set_params([delta, alpha, beta, gamma, omega], requires_grad)
 
-        self.x0 = self.B.cast([1.0, 0.0])
+        self.x0 = self._cast([1.0, 0.0])
         self.nx = 2
-        self.xstats = self.get_stats()
+        self._dx = np.empty(self.nx)
 
     def equations(self, t, x):
-        dx1 = x[1]
-        dx2 = - self.delta*x[1] - self.alpha*x[0] - self.beta*x[0]**3 + self.gamma*self.B.core.cos(self.omega*t)
-        return self.B.cast([dx1, dx2])
-
-
+        if self.B.jit and x.ndim == 1:
+            return _duffing_rhs(t, x, float(self.delta), float(self.alpha), float(self.beta),
+                                float(self.gamma), float(self.omega), np.empty(self.nx))
+        cos = self._cos
+        x1, x2 = self._unstack(x)
+        dx1 = x2
+        dx2 = - self.delta*x2 - self.alpha*x1 - self.beta*x1**3 + self.gamma*cos(self.omega*t)
+        return self._stack([dx1, dx2])
+
+    def jacobian(self, t, x):
+        return np.array([[0., 1.],
+                         [-self.alpha - 3.*self.beta*x[0]**2, -self.delta]])
+
+
+@jit
+def _autoignition_rhs(t, x, alpha, uc, s, k, r, q, up, e, dx):
+    reactionRate = k * (1.0 - x[1]) * np.exp((x[0] - uc) / alpha)
+    regenRate = s * up * x[1] / (1.0 + np.exp(r * (x[0] - up)))
+    dx[0] = q * reactionRate - e * x[0] ** 2
+    dx[1] = reactionRate - regenRate
+    return dx
+
+
+@_register
 class Autoignition(ODE_Autonomous):
     """
     ODE describing pulsating instability in open-ended combustor.
@@ -436,8 +1024,12 @@ class Autoignition(ODE_Autonomous):
       Physical Review E, 2021
     """
 
-    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False):
-        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad)
+    _kernel = staticmethod(_autoignition_rhs)
+    _kernel_params = ('alpha', 'uc', 's', 'k', 'r', 'q', 'up', 'e')
+
+    def __init__(self, nsim=1001, ninit=0, ts=0.1, seed=59, backend='numpy', requires_grad=False, adjoint=False):
+        super().__init__(nsim=nsim, ninit=ninit, ts=ts, seed=seed, backend=backend, requires_grad=requires_grad,
+                         adjoint=adjoint)
         alpha = 0.3
         uc = 1.1
         s = 1.0
@@ -448,18 +1040,130 @@ class Autoignition(ODE_Autonomous):
         e = 1.0
         self.alpha, self.uc, self.s, self.k, self.r, self.q, self.up, self.e = self.set_params([alpha, uc, s, k, r, q, up, e], requires_grad)
 
-        self.x0 = self.B.cast([1.0, 0.7])
+        self.x0 = self._cast([1.0, 0.7])
         self.nx = 2
-        self.xstats = self.get_stats()
+        self._dx = np.empty(self.nx)
 
     def equations(self, t, x):
-        reactionRate = self.k * (1.0 - x[1]) * self.B.core.exp((x[0] - self.uc) / self.alpha)
-        regenRate = self.s * self.up * x[1] / (1.0 + self.B.core.exp(self.r * (x[0] - self.up)))
-        dx1 = self.q * reactionRate - self.e * x[0] ** 2
+        if self.B.jit and x.ndim == 1:
+            return _autoignition_rhs(t, x, float(self.alpha), float(self.uc), float(self.s), float(self.k),
+                                     float(self.r), float(self.q), float(self.up), float(self.e), np.empty(self.nx))
+        exp = self._exp
+        x1, x2 = self._unstack(x)
+        reactionRate = self.k * (1.0 - x2) * exp((x1 - self.uc) / self.alpha)
+        regenRate = self.s * self.up * x2 / (1.0 + exp(self.r * (x1 - self.up)))
+        dx1 = self.q * reactionRate - self.e * x1 ** 2
         dx2 = reactionRate - regenRate
-        return self.B.cast([dx1, dx2])
+        return self._stack([dx1, dx2])
+
+    def jacobian(self, t, x):
+        expu = np.exp((x[0] - self.uc) / self.alpha)
+        expr = np.exp(self.r * (x[0] - self.up))
+        reactionRate = self.k * (1.0 - x[1]) * expu
+        dreaction_dx0, dreaction_dx1 = reactionRate / self.alpha, -self.k * expu
+        dregen_dx0 = -self.s * self.up * x[1] * self.r * expr / (1.0 + expr) ** 2
+        dregen_dx1 = self.s * self.up / (1.0 + expr)
+        return np.array([[self.q * dreaction_dx0 - 2. * self.e * x[0], self.q * dreaction_dx1],
+                         [dreaction_dx0 - dregen_dx0, dreaction_dx1 - dregen_dx1]])
+
 
+# Kernels of the systems that _rk4_dispatch selects by integer tag, a system's tag is the index of its kernel
+_dispatch_kernels = (_universal_oscillator_rhs, _pendulum_rhs, _double_pendulum_rhs, _lorenz96_rhs, _lorenz_rhs,
+                     _van_der_pol_rhs, _thomas_rhs, _rossler_rhs, _lotka_volterra_rhs, _brusselator_rhs, _chua_rhs,
+                     _duffing_rhs, _autoignition_rhs)
 
-systems = dict(inspect.getmembers(sys.modules[__name__], lambda x: inspect.isclass(x)))
-systems = {k: v for k, v in systems.items() if issubclass(v, ODE_Autonomous) and v is not ODE_Autonomous}
 
+@jit
+def _rk4_dispatch(kernels, tag, p, x0, Time, substeps):
+    """
+    _rk4 with the kernel kernels[tag]. The branch is taken once per trajectory rather than in a
+    dispatching right hand side: a branch per call keeps the kernel from being inlined into the RK4 loop and
+    made the steps about ten times slower
+
+    :param kernels: (tuple) _dispatch_kernels, passed in rather than referenced as globals so the compiled
+                    function can be cached
+    :param tag: (int) index of the system kernel in kernels
+    :param p: (np.array) kernel parameters in the order of the system's _kernel_params, padded at the end
+    """
+    if tag == 0:
+        return _rk4(kernels[0], (p[0], p[1]), x0, Time, substeps)
+    elif tag == 1:
+        return _rk4(kernels[1], (p[0], p[1]), x0, Time, substeps)
+    elif tag == 2:
+        return _rk4(kernels[2], (p[0], p[1], p[2], p[3], p[4]), x0, Time, substeps)
+    elif tag == 3:
+        return _rk4(kernels[3], (p[0],), x0, Time, substeps)
+    elif tag == 4:
+        return _rk4(kernels[4], (p[0], p[1], p[2]), x0, Time, substeps)
+    elif tag == 5:
+        return _rk4(kernels[5], (p[0],), x0, Time, substeps)
+    elif tag == 6:
+        return _rk4(kernels[6], (p[0],), x0, Time, substeps)
+    elif tag == 7:
+        return _rk4(kernels[7], (p[0], p[1], p[2]), x0, Time, substeps)
+    elif tag == 8:
+        return _rk4(kernels[8], (p[0], p[1], p[2], p[3]), x0, Time, substeps)
+    elif tag == 9:
+        return _rk4(kernels[9], (p[0], p[1]), x0, Time, substeps)
+    elif tag == 10:
+        return _rk4(kernels[10], (p[0], p[1], p[2], p[3]), x0, Time, substeps)
+    elif tag == 11:
+        return _rk4(kernels[11], (p[0], p[1], p[2], p[3], p[4]), x0, Time, substeps)
+    return _rk4(kernels[12], (p[0], p[1], p[2], p[3], p[4], p[5], p[6], p[7]), x0, Time, substeps)
+
+
+@jit(parallel=True)
+def _rk4_dispatch_batch(kernels, tags, nxs, P, X0, Time, substeps):
+    """
+    Integrate a batch mixing different systems with _rk4_dispatch, trajectories are distributed over threads.
+    Row b holds the nxs[b] states of system tags[b], the remaining columns are padding and stay zero
+
+    :param P: (np.array shape=(nbatch, np)) padded kernel parameters
+    :param X0: (np.array shape=(nbatch, nxmax)) padded state initial conditions
+    :return: (np.array shape=(nsim+1, nbatch, nxmax)) padded state trajectories
+    """
+    X = np.zeros((Time.shape[0], X0.shape[0], X0.shape[1]))
+    for b in prange(X0.shape[0]):
+        X[:, b, :nxs[b]] = _rk4_dispatch(kernels, tags[b], P[b], X0[b, :nxs[b]], Time, substeps[b])
+    return X
+
+
+def systems_batched(models, X0=None, ninit=None, nsim=None, Time=None, ts=None):
+    """
+    Simulate a batch mixing instances of different systems in a single parallel compiled RK4 loop, with the
+    time grid of the first model. Rows are padded to the largest state dimension in the batch, so a mixed batch
+    with Lorenz96 (nx=36) integrates 36 columns per row: batch systems of similar size together.
+
+    :param models: (list of ODE_Autonomous) systems with a compiled kernel, each integrated with its parameters
+    :param X0: (list of np.array) state initial conditions of the models, defaults to their x0
+    :param nsim: (int) Number of steps for open loop response
+    :param ninit: (float) initial simulation time
+    :param ts: (float) step size, sampling time
+    :return: The response matrices X and Y with shape=(nsim+1, nbatch, nxmax), zero beyond the nx of each model
+    """
+    if numba is None:
+        raise ImportError("systems_batched requires numba, install it with pip install neuromancer[jit]")
+    if any(model._kernel not in _dispatch_kernels for model in models):
+        raise NotImplementedError("systems_batched requires systems with a kernel known to _rk4_dispatch")
+    first = models[0]
+    ninit = ninit if ninit is not None else first.ninit
+    nsim = nsim if nsim is not None else first.nsim
+    ts = ts if ts is not None else first.ts
+    Time = Time if Time is not None else np.arange(0, nsim+1) * ts + ninit
+    X0 = X0 if X0 is not None else [model.x0 for model in models]
+
+    nxs = np.array([model.nx for model in models])
+    tags = np.array([_dispatch_kernels.index(model._kernel) for model in models])
+    substeps = np.array([model.rk4_substeps for model in models])
+    P = np.zeros((len(models), max(len(model._kernel_params) for model in models)))
+    X0_padded = np.zeros((len(models), nxs.max()))
+    for b, model in enumerate(models):
+        params = model._params()
+        P[b, :len(params)] = params
+        X0_padded[b, :model.nx] = X0[b]
+    with warnings.catch_warnings():
+        # The tuple of kernels is typed with numba's experimental first-class function types
+        warnings.simplefilter('ignore', numba.NumbaExperimentalFeatureWarning)
+        X = _rk4_dispatch_batch(_dispatch_kernels, tags, nxs, P, X0_padded, np.asarray(Time, dtype=np.float64),
+                                substeps)
+    return {'Y': X, 'X': X}
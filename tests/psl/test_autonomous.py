@@ -0,0 +1,180 @@
+from hypothesis import given, settings, strategies as st
+import os
+import pytest
+import numpy as np
+import torch
+import neuromancer.psl.autonomous as auto
+
+"""
+Test functions for psl autonomous systems
+checking compiled right hand side kernels against the backend generic equations
+"""
+
+
+@pytest.fixture(autouse=True, scope='module')
+def xstats_cache(tmp_path_factory):
+    """
+    Keep the xstats disk cache of the tests out of the user's cache directory
+    """
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('NEUROMANCER_CACHE_DIR', str(tmp_path_factory.mktemp('xstats')))
+        yield
+
+
+@pytest.mark.skipif(auto.numba is None, reason="compiled kernels require numba")
+@given(
+    st.sampled_from(list(auto.systems.values())),
+    st.floats(0., 10.),
+)
+@settings(max_examples=50, deadline=None)
+def test_jit_equations_match_backend(system, t):
+    model = system(nsim=10)
+    x = model.get_x0()
+    dx = np.array(model.equations(t, x))
+    model.B.jit = False
+    dx_ref = model.equations(t, x)
+    assert dx.shape == (model.nx,)
+    assert np.allclose(dx, dx_ref)
+
+
+@pytest.mark.skipif(auto.numba is None, reason="numba backend requires numba")
+@given(
+    st.sampled_from(list(auto.systems.values())),
+)
+@settings(max_examples=20, deadline=None)
+def test_numba_backend_matches_odeint(system):
+    X_ref = system(nsim=10).simulate()['X']
+    X = system(nsim=10, backend='numba').simulate()['X']
+    assert X.shape == X_ref.shape
+    assert np.allclose(X, X_ref, rtol=1e-3, atol=1e-3)
+
+
+@pytest.mark.skipif(auto.numba is None, reason="systems_batched requires numba")
+@given(
+    st.lists(st.sampled_from(list(auto.systems.values())), min_size=1, max_size=4),
+)
+@settings(max_examples=20, deadline=None)
+def test_systems_batched_matches_numba_backend(systems):
+    models = [system(nsim=10, backend='numba') for system in systems]
+    Time = np.arange(0, 11) * models[0].ts
+    X = auto.systems_batched(models, Time=Time)['X']
+    assert X.shape == (11, len(models), max(model.nx for model in models))
+    for b, model in enumerate(models):
+        assert np.allclose(X[:, b, :model.nx], model.simulate(Time=Time)['X'])
+        assert not X[:, b, model.nx:].any()
+
+
+@given(
+    st.sampled_from(list(auto.systems.values())),
+    st.integers(1, 4),
+)
+@settings(max_examples=20, deadline=None)
+def test_simulate_batch_matches_simulate(system, nbatch):
+    model = system(nsim=10)
+    X0 = np.stack([model.get_x0() for _ in range(nbatch)])
+    X = model.simulate_batch(X0)['X']
+    assert X.shape == (11, nbatch, model.nx)
+    for i in range(nbatch):
+        assert np.allclose(X[:, i], model.simulate(x0=X0[i])['X'], rtol=1e-3, atol=1e-3)
+
+
+@given(
+    st.sampled_from(list(auto.systems.values())),
+    st.floats(0., 10.),
+)
+@settings(max_examples=50, deadline=None)
+def test_jacobian_matches_finite_differences(system, t):
+    model = system(nsim=10)
+    x = model.get_x0()
+    eps = 1e-6
+    J_fd = np.stack([(np.array(model.equations(t, x + eps*e)) - np.array(model.equations(t, x - eps*e))) / (2*eps)
+                     for e in np.eye(model.nx)], axis=1)
+    assert np.allclose(model.jacobian(t, x), J_fd, rtol=1e-4, atol=1e-4)
+
+
+@given(
+    st.sampled_from(list(auto.systems.values())),
+    st.lists(st.floats(0.9, 1.1), min_size=1, max_size=4),
+)
+@settings(max_examples=20, deadline=None)
+def test_batched_parameters_match_individual_systems(system, scales):
+    name = system._kernel_params[0]
+    values = float(getattr(system(nsim=10), name)) * np.array(scales)
+    X = system.batched({name: values}, nsim=10).simulate()['X']
+    assert X.shape[:2] == (11, len(values))
+    for i, value in enumerate(values):
+        model = system(nsim=10)
+        setattr(model, name, value)
+        assert np.allclose(X[:, i], model.simulate()['X'], rtol=1e-3, atol=1e-3)
+
+
+class Oscillator(auto.ODE_Autonomous):
+    """
+    System without a compiled kernel, listing no _kernel_params
+    """
+    def __init__(self, k=1., **kwargs):
+        super().__init__(**kwargs)
+        self.k, = self.set_params([k], False)
+        self.x0 = self._cast([1., 0.])
+        self.nx = 2
+
+    def equations(self, t, x):
+        x1, x2 = self._unstack(x)
+        return self._stack([x2, -self.k*x1])
+
+
+def test_xstats_cache_hit_and_miss(tmp_path, monkeypatch):
+    monkeypatch.setenv('NEUROMANCER_CACHE_DIR', str(tmp_path))
+    stats = auto.LorenzSystem(nsim=10).xstats
+    assert len(os.listdir(tmp_path)) == 1
+    model = auto.LorenzSystem(nsim=10)
+    model.get_stats = lambda: pytest.fail('cached xstats were recomputed')
+    assert all(np.array_equal(stats[k], model.xstats[k]) for k in stats)
+    model = auto.LorenzSystem(nsim=10)
+    model.rho = 20.
+    assert not np.array_equal(stats['max'], model.xstats['max'])
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_xstats_cache_keys_parameters_of_systems_without_kernel(tmp_path, monkeypatch):
+    monkeypatch.setenv('NEUROMANCER_CACHE_DIR', str(tmp_path))
+    assert np.allclose(Oscillator(k=1.).xstats['max'], [1., 1.], atol=1e-3)
+    assert np.allclose(Oscillator(k=100.).xstats['max'], [1., 10.], atol=1e-2)
+
+
+def test_xstats_unwritable_cache_directory(tmp_path, monkeypatch):
+    (tmp_path / 'file').write_text('')
+    monkeypatch.setenv('NEUROMANCER_CACHE_DIR', str(tmp_path / 'file' / 'cache'))
+    stats = auto.VanDerPol(nsim=10).xstats
+    assert stats['max'].shape == (2,)
+
+
+@given(
+    st.sampled_from(list(auto.systems.values())),
+)
+@settings(max_examples=20, deadline=None)
+def test_torch_backend_matches_numpy(system):
+    X_ref = system(nsim=10).simulate()['X']
+    X = system(nsim=10, backend='torch').to(torch.float64).simulate()['X']
+    assert X.shape == X_ref.shape
+    assert np.allclose(X.detach().numpy(), X_ref, rtol=1e-3, atol=1e-3)
+
+
+def test_torch_backend_gradients_with_and_without_adjoint():
+    grads = []
+    for adjoint in [False, True]:
+        model = auto.LorenzSystem(nsim=10, backend='torch', requires_grad=True, adjoint=adjoint).to(torch.float64)
+        model.simulate()['X'].sum().backward()
+        grads.append(torch.stack([model.sigma.grad, model.rho.grad, model.beta.grad]))
+        assert torch.isfinite(grads[-1]).all() and (grads[-1] != 0).any()
+    assert torch.allclose(grads[0], grads[1], rtol=1e-3)
+
+
+def test_torch_backend_to_moves_parameters_and_x0():
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    model = auto.VanDerPol(nsim=10, backend='torch').to(device=device, dtype=torch.float64)
+    assert 'x0' in dict(model.named_buffers())
+    for tensor in [model.x0, model.mu]:
+        assert tensor.device.type == device and tensor.dtype == torch.float64
+    X = model.simulate()['X']
+    assert X.device.type == device and X.dtype == torch.float64